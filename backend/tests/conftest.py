@@ -2,8 +2,11 @@ import tempfile
 from pathlib import Path
 
 import pytest
+from alembic import command
+from alembic.config import Config
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from sqlmodel import Session, SQLModel, create_engine
 from sqlmodel.pool import StaticPool
 from transcribee_backend.auth import (
@@ -37,38 +40,62 @@ def app_with_memory_session(memory_session: Session):
     del app.dependency_overrides[get_session]
 
 
+# The clients are shared between all tests, only the session override and the
+# auth headers change. They are deliberately not used as context managers, which
+# would run the app's startup events (and thus the periodic tasks).
+@pytest.fixture(scope="session")
+def _client():
+    return TestClient(app)
+
+
+@pytest.fixture(scope="session")
+def _logged_in_client():
+    return TestClient(app)
+
+
+@pytest.fixture(scope="session")
+def _logged_in_client_user_2():
+    return TestClient(app)
+
+
 @pytest.fixture
-def client(app_with_memory_session: FastAPI):
-    client = TestClient(app_with_memory_session)
-    return client
+def client(app_with_memory_session: FastAPI, _client: TestClient):
+    return _client
 
 
 @pytest.fixture
-def logged_in_client(app_with_memory_session: FastAPI, auth_token: str):
-    client = TestClient(
-        app_with_memory_session, headers={"Authorization": f"Token {auth_token}"}
-    )
-    return client
+def logged_in_client(
+    app_with_memory_session: FastAPI, auth_token: str, _logged_in_client: TestClient
+):
+    _logged_in_client.headers["Authorization"] = f"Token {auth_token}"
+    yield _logged_in_client
+    del _logged_in_client.headers["Authorization"]
 
 
 @pytest.fixture
-def logged_in_client_user_2(app_with_memory_session: FastAPI, auth_token_user_2: str):
-    client = TestClient(
-        app_with_memory_session, headers={"Authorization": f"Token {auth_token_user_2}"}
+def logged_in_client_user_2(
+    app_with_memory_session: FastAPI,
+    auth_token_user_2: str,
+    _logged_in_client_user_2: TestClient,
+):
+    _logged_in_client_user_2.headers["Authorization"] = f"Token {auth_token_user_2}"
+    yield _logged_in_client_user_2
+    del _logged_in_client_user_2.headers["Authorization"]
+
+
+def create_memory_engine():
+    return create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
     )
-    return client
 
 
 @pytest.fixture
 def alembic_engine():
-    engine = create_engine(
-        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
-    )
-    return engine
+    return create_memory_engine()
 
 
-@pytest.fixture(params=[False, True])
-def memory_session(request, alembic_engine, alembic_runner):
+@pytest.fixture(scope="session", params=[False, True])
+def memory_engine(request):
     # We run all tests two times:
     # - The first time we setup the table directly via sqlmodel
     # - The second time we migrate using alembic
@@ -78,14 +105,57 @@ def memory_session(request, alembic_engine, alembic_runner):
     # Note: This is probably redundant, because we also check that the
     # migrations generate the proper models in
     # `test_model_definitions_match_ddl`
+    engine = create_memory_engine()
+
+    # pysqlite does not emit BEGIN itself, which breaks SAVEPOINTs, see
+    # https://docs.sqlalchemy.org/en/14/dialects/sqlite.html#serializable-isolation-savepoints-transactional-ddl
+    @event.listens_for(engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
     migrate = request.param
     if migrate:
-        for head in alembic_runner.heads:
-            alembic_runner.migrate_up_to(head)
+        alembic_config = Config(Path(__file__).parent.parent / "alembic.ini")
+        alembic_config.set_main_option(
+            "script_location",
+            str(Path(__file__).parent.parent / "transcribee_backend/db/migrations"),
+        )
+        alembic_config.attributes["connection"] = engine
+        command.upgrade(alembic_config, "heads")
     else:
-        SQLModel.metadata.create_all(alembic_engine)
-    with Session(alembic_engine) as session:
-        yield session
+        SQLModel.metadata.create_all(engine)
+
+    yield engine
+
+    engine.dispose()
+
+
+@pytest.fixture
+def memory_session(memory_engine):
+    # The schema is only created once per `memory_engine`, every test runs in a
+    # transaction that is rolled back afterwards. Commits inside of the test only
+    # release a SAVEPOINT, see
+    # https://docs.sqlalchemy.org/en/14/orm/session_transaction.html#joining-a-session-into-an-external-transaction-such-as-for-test-suites
+    connection = memory_engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection)
+    session.begin_nested()
+
+    @event.listens_for(session, "after_transaction_end")
+    def restart_savepoint(session, transaction):
+        if transaction.nested and not transaction._parent.nested:
+            session.expire_all()
+            session.begin_nested()
+
+    yield session
+
+    session.close()
+    transaction.rollback()
+    connection.close()
 
 
 @pytest.fixture
@@ -1,7 +1,8 @@
 import pytest
 from fastapi.testclient import TestClient
+from fastapi.websockets import WebSocketDisconnect
 from sqlmodel import Session
-from transcribee_backend.auth import generate_share_token
+from transcribee_backend.auth import create_worker, generate_share_token
 from transcribee_backend.config import settings
 from transcribee_backend.models import (
     Document,
@@ -13,6 +14,7 @@ from transcribee_backend.models import (
     TaskAttempt,
     TaskDependency,
 )
+from transcribee_proto.sync import SyncMessageType
 
 
 @pytest.fixture
@@ -170,3 +172,53 @@ def test_doc_share(
         k: v for k, v in req.json().items() if k not in ["has_full_access", "can_write"]
     }
     assert req_json_without_auth == ref_req_json_without_auth
+
+
+def _assert_backlog_received(websocket):
+    websocket.receive()  # FULL_DOCUMENT
+    assert websocket.receive_bytes() == bytes([SyncMessageType.CHANGE_BACKLOG_COMPLETE])
+
+
+def test_doc_sync_auth(client: TestClient, auth_token: str, document_id: str):
+    url = f"/api/v1/documents/sync/{document_id}/"
+
+    # query parameters are used by the frontend, headers by the worker
+    for kwargs in [
+        {"params": {"authorization": f"Token {auth_token}"}},
+        {"headers": {"Authorization": f"Token {auth_token}"}},
+        # browsers may send cached basic auth credentials alongside the query parameter
+        {
+            "params": {"authorization": f"Token {auth_token}"},
+            "headers": {"Authorization": "Basic dXNlcjpwYXNz"},
+        },
+    ]:
+        with client.websocket_connect(url, **kwargs) as websocket:
+            _assert_backlog_received(websocket)
+
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(url) as websocket:
+            websocket.receive_bytes()
+
+
+def test_doc_sync_worker_auth(
+    memory_session: Session, client: TestClient, document_id: str
+):
+    worker = create_worker(session=memory_session, name="test_worker")
+    headers = {"Authorization": f"Worker {worker.token}"}
+    url = f"/api/v1/documents/sync/{document_id}/"
+
+    # workers may only sync documents they have a task for
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(url, headers=headers) as websocket:
+            websocket.receive_bytes()
+
+    req = client.post(
+        "/api/v1/tasks/claim_unassigned_task/",
+        params={"task_type": "REENCODE"},
+        headers=headers,
+    )
+    assert req.status_code == 200
+    assert req.json()["document"]["id"] == document_id
+
+    with client.websocket_connect(url, headers=headers) as websocket:
+        _assert_backlog_received(websocket)
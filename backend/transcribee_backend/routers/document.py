@@ -204,12 +204,20 @@ def auth_fn_to_ws(f: Callable):
         session: Session = Depends(get_session),
         authorization: Optional[str] = Query(default=None),
         share_token: Optional[str] = Query(default=None, alias="share_token"),
+        authorization_header: Optional[str] = Header(
+            default=None, alias="Authorization"
+        ),
     ):
+        # Browsers cannot set headers for websocket connections, so we also accept
+        # the credentials as query parameters. These take precedence, as browsers may
+        # still attach cached HTTP basic auth credentials as header
         try:
             return f(
                 document_id=document_id,
                 session=session,
-                authorization=authorization,
+                authorization=(
+                    authorization if authorization is not None else authorization_header
+                ),
                 share_token=share_token,
             )
         except HTTPException:
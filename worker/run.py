@@ -2,20 +2,37 @@
 
 import argparse
 import asyncio
+import importlib
 import logging
+import queue
+import random
+import sys
+import threading
 import traceback
 import urllib.parse
-from multiprocessing import Event, Process
+from graphlib import TopologicalSorter
+from multiprocessing import Event, Process, Queue
 from pathlib import Path
+from types import ModuleType
+from typing import Optional
 
-import requests.exceptions
+import httpx
 from transcribee_worker.config import settings
-from watchfiles import watch
+from watchfiles import PythonFilter, watch
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 logging.basicConfig(level=logging.INFO)
 
 settings.setup_env_vars()
 
+# seconds to wait after an error, doubled on every consecutive error
+INITIAL_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -37,6 +54,12 @@ def main():
     parser.add_argument("--token", help="Worker token", required=True)
     parser.add_argument("--run-once-and-dont-complete", action="store_true")
     parser.add_argument("--reload", action="store_true")
+    parser.add_argument(
+        "--processes",
+        help="number of worker processes to start in reload mode",
+        type=int,
+        default=1,
+    )
     args = parser.parse_args()
 
     if args.websocket_base_url is None:
@@ -51,54 +74,158 @@ def main():
     if args.reload:
         path = Path(__file__).parent
 
-        p, event = run_sync_in_process(args)
-        for _ in watch(path):
+        # The worker processes are kept alive across source code changes, so that
+        # models that are already loaded don't need to be loaded again. Instead,
+        # each process reloads the changed modules between two tasks.
+        event = Event()
+        reload_queues = [
+            run_sync_in_process(args, event) for _ in range(args.processes)
+        ]
+        for changes in watch(path, watch_filter=PythonFilter()):
             logging.info("Source code change detected, reloading worker")
-            event.set()
-            p.join()
-            p, event = run_sync_in_process(args)
+            changed_paths = [changed_path for _, changed_path in changes]
+            for reload_queue in reload_queues:
+                reload_queue.put(changed_paths)
 
     else:
         run_sync(args, Event())
 
 
-def run_sync_in_process(args):
-    event = Event()
-    p = Process(target=run_sync, args=(args, event))
+def run_sync_in_process(args, event):
+    reload_queue = Queue()
+    p = Process(target=run_sync, args=(args, event, reload_queue))
     p.start()
-    return p, event
+    return reload_queue
 
 
-def run_sync(args, event):
-    asyncio.run(run(args, event))
+def run_sync(args, event, reload_queue: Optional[Queue] = None):
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(run(args, event, reload_queue))
 
 
-async def run(args, event: Event):
+def create_worker(args):
     # Needs to be done after settings.setup_env
     from transcribee_worker.worker import Worker  # noqa
 
-    worker = Worker(
+    return Worker(
         base_url=f"{args.coordinator}/api/v1/tasks",
         websocket_base_url=args.websocket_base_url,
         token=args.token,
     )
+
+
+def worker_module_dependencies(module: ModuleType) -> set[str]:
+    """Returns the names of the `transcribee_worker` modules `module` imports from."""
+    dependencies = set()
+    for value in vars(module).values():
+        if isinstance(value, ModuleType):
+            name = value.__name__
+        else:
+            name = getattr(value, "__module__", None)
+        if isinstance(name, str) and name.startswith("transcribee_worker"):
+            dependencies.add(name)
+    dependencies.discard(module.__name__)
+    return dependencies
+
+
+def reload_worker_modules(changed_paths: list[str]):
+    changed_paths_resolved = {Path(path).resolve() for path in changed_paths}
+    modules = {
+        name: module
+        for name, module in list(sys.modules.items())
+        if name.startswith("transcribee_worker")
+    }
+    dependencies = {
+        name: worker_module_dependencies(module) & modules.keys()
+        for name, module in modules.items()
+    }
+
+    # Modules are reloaded leaves first, so that every module picks up the new objects
+    # of the modules it imports from. Modules that did not change and don't import from
+    # a reloaded module keep their state, for example the cached alignment models.
+    reloaded = set()
+    for name in TopologicalSorter(dependencies).static_order():
+        module_file = getattr(modules[name], "__file__", None)
+        changed = (
+            module_file is not None
+            and Path(module_file).resolve() in changed_paths_resolved
+        )
+        if changed or dependencies[name] & reloaded:
+            logging.info(f"Reloading {name}")
+            importlib.reload(modules[name])
+            reloaded.add(name)
+
+
+def get_changed_paths(reload_queue: Optional[Queue]) -> list[str]:
+    changed_paths = []
+    if reload_queue is not None:
+        try:
+            while True:
+                changed_paths.extend(reload_queue.get_nowait())
+        except queue.Empty:
+            pass
+    return changed_paths
+
+
+def mirror_event(event: Event) -> asyncio.Event:
+    """
+    Returns an `asyncio.Event` that is set once the given `multiprocessing.Event` is set.
+    This allows waiting for the `multiprocessing.Event` without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    async_event = asyncio.Event()
+
+    def _wait():
+        event.wait()
+        loop.call_soon_threadsafe(async_event.set)
+
+    threading.Thread(target=_wait, daemon=True).start()
+    return async_event
+
+
+async def wait_for_event(event: asyncio.Event, timeout: float):
+    try:
+        await asyncio.wait_for(event.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def run(args, event: Event, reload_queue: Optional[Queue] = None):
+    worker = create_worker(args)
+    async_event = mirror_event(event)
+    backoff = INITIAL_BACKOFF
+
+    async def wait_backoff():
+        nonlocal backoff
+        # the jitter prevents all workers from reconnecting at the same time
+        await wait_for_event(async_event, backoff + random.uniform(0, backoff * 0.1))
+        backoff = min(backoff * 2, MAX_BACKOFF)
+
     while not event.is_set():
         try:
+            changed_paths = get_changed_paths(reload_queue)
+            if changed_paths:
+                reload_worker_modules(changed_paths)
+                await worker.api_client.http.aclose()
+                worker = create_worker(args)
+
             no_work = await worker.run_task(
                 mark_completed=not args.run_once_and_dont_complete
             )
+            backoff = INITIAL_BACKOFF
             if no_work:
-                event.wait(5)
+                await wait_for_event(async_event, 5)
             elif args.run_once_and_dont_complete:
                 break
-        except requests.exceptions.ConnectionError:
+        except httpx.ConnectError:
             logging.warn("could not connect to backend")
-            event.wait(5)
+            await wait_backoff()
         except Exception:
             logging.warn(
                 f"an error occured during worker execution:\n{traceback.format_exc()}"
             )
-            event.wait(5)
+            await wait_backoff()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+from transcribee_worker.util import abatch
+
+
+async def _delayed_items():
+    for i in range(5):
+        yield i
+    await asyncio.sleep(0.2)
+    for i in range(5, 7):
+        yield i
+
+
+def test_abatch():
+    async def run():
+        return [batch async for batch in abatch(_delayed_items(), 3, 0.05)]
+
+    assert asyncio.run(run()) == [[0, 1, 2], [3, 4], [5, 6]]
+
+
+async def _failing_items():
+    yield 1
+    yield 2
+    raise RuntimeError("source failed")
+
+
+def test_abatch_yields_pending_batch_on_error():
+    batches = []
+
+    async def run():
+        async for batch in abatch(_failing_items(), 3, 0.05):
+            batches.append(batch)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert batches == [[1, 2]]
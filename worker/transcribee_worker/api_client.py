@@ -4,9 +4,9 @@ import urllib.parse
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
-import requests
+import httpx
 from transcribee_worker.document import SyncedDocument
-from websockets.client import connect
+from websockets.asyncio.client import connect
 
 
 class ApiClient:
@@ -14,12 +14,17 @@ class ApiClient:
         self.base_url = base_url
         self.websocket_base_url = websocket_base_url
         self.token = token
+        self._ws_headers = self._get_headers()
+        # no timeout, uploading / downloading large media files can take a while.
+        # unlike requests, httpx doesn't follow redirects by default (e.g. to a CDN or
+        # object store serving the media files)
+        self.http = httpx.AsyncClient(timeout=None, follow_redirects=True)
 
     def _get_headers(self):
         return {"authorization": f"Worker {self.token}"}
 
-    def post(self, url, **kwargs):
-        req = requests.post(
+    async def post(self, url, **kwargs):
+        req = await self.http.post(
             self._get_url(url),
             **kwargs,
             headers=self._get_headers(),
@@ -30,16 +35,24 @@ class ApiClient:
     def _get_url(self, url):
         return urllib.parse.urljoin(self.base_url, url)
 
-    def get(self, url):
-        req = requests.get(self._get_url(url))
-        req.raise_for_status()
-        return req
+    @asynccontextmanager
+    async def stream(self, url, **kwargs) -> AsyncGenerator[httpx.Response, None]:
+        async with self.http.stream("GET", self._get_url(url), **kwargs) as req:
+            req.raise_for_status()
+            yield req
 
     @asynccontextmanager
     async def document(self, id: str) -> AsyncGenerator[SyncedDocument, None]:
-        params = urllib.parse.urlencode(self._get_headers())
+        # automerge changes are already compactly encoded, so deflating them only
+        # costs cpu time on both ends
         async with connect(
-            f"{self.websocket_base_url}{id}/?{params}", max_size=None
+            f"{self.websocket_base_url}{id}/",
+            additional_headers=self._ws_headers,
+            max_size=None,
+            # SyncedDocument reads (and discards) incoming messages for as long as
+            # the document is open, so there is no need for flow control
+            max_queue=None,
+            compression=None,
         ) as websocket:
             doc = await SyncedDocument.create(websocket)
             try:
@@ -24,7 +24,15 @@ class Settings(BaseSettings):
         },
     }
 
-    KEEPALIVE_INTERVAL: float = 0.5
+    KEEPALIVE_INTERVAL: float = 2  # seconds
+    # keepalives without a progress change are sent less often, this needs to be well
+    # below the `worker_timeout` of the backend
+    KEEPALIVE_MAX_INTERVAL: float = 10  # seconds
+
+    # transcribed / aligned paragraphs produced faster than this are combined into a
+    # single change
+    CHANGE_BATCH_SIZE: int = 16
+    CHANGE_BATCH_INTERVAL: float = 0.25  # seconds
 
     class Config:
         env_file = ".env"
@@ -7,7 +7,8 @@ from typing import AsyncGenerator
 import automerge
 from transcribee_proto.document import Document as EditorDocument
 from transcribee_proto.sync import SyncMessageType
-from websockets.client import WebSocketClientProtocol
+from websockets.asyncio.client import ClientConnection
+from websockets.exceptions import ConnectionClosed
 
 
 class UnsupportedDocumentVersion(Exception):
@@ -16,7 +17,7 @@ class UnsupportedDocumentVersion(Exception):
 
 class SyncedDocument:
     doc: automerge.Document
-    conn: WebSocketClientProtocol
+    conn: ClientConnection
     _stop: asyncio.Event
     _discard_messages_task: asyncio.Task
 
@@ -26,8 +27,8 @@ class SyncedDocument:
         self.conn = connection
         self.doc = await self._get_document_state()
         await self._preprocess_doc()
-        self._discard_messages_task = asyncio.create_task(self._discard_messages())
         self._stop = asyncio.Event()
+        self._discard_messages_task = asyncio.create_task(self._discard_messages())
         return self
 
     @asynccontextmanager
@@ -39,17 +40,23 @@ class SyncedDocument:
             await self._send_change(change)
 
     async def _discard_messages(self):
-        pending = [self._stop.wait(), self.conn.recv()]
-        while True:
-            done, pending = await asyncio.wait(
-                pending, return_when=asyncio.FIRST_COMPLETED
-            )
-            if self._stop.is_set():
-                for task in pending:
-                    task.cancel()
+        stop = asyncio.create_task(self._stop.wait())
+        recv = asyncio.create_task(self.conn.recv())
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {stop, recv}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if stop in done:
                     return
-            else:
-                pending.add(self.conn.recv())
+                try:
+                    recv.result()
+                except ConnectionClosed:
+                    return
+                recv = asyncio.create_task(self.conn.recv())
+        finally:
+            stop.cancel()
+            recv.cancel()
 
     def stop(self):
         self._stop.set()
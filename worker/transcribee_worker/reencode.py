@@ -1,13 +1,38 @@
+import re
 import subprocess
+import threading
 from pathlib import Path
+from typing import IO, Any, Awaitable, Callable, Optional
 
 import ffmpeg
 from transcribee_worker.types import ProgressCallbackType
-from transcribee_worker.util import alist, async_task
+from transcribee_worker.util import async_task
+
+# by default ffmpeg analyzes up to 5 seconds of input before it starts processing
+FAST_PROBE_PARAMS = {"probesize": "32k", "analyzeduration": "0"}
+
+DURATION_RE = re.compile(rb"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
 
 
 def get_duration(input_path: Path):
-    return float(ffmpeg.probe(input_path)["format"]["duration"])
+    return float(ffmpeg.probe(input_path, **FAST_PROBE_PARAMS)["format"]["duration"])
+
+
+def _read_duration(stderr: IO[bytes]) -> Optional[float]:
+    # ffmpeg logs the input information (including its duration) before the output
+    # information, so we can stop looking once we reach the output section
+    for raw_line in stderr:
+        match = DURATION_RE.search(raw_line)
+        if match:
+            hours, minutes, seconds = match.groups()
+            return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        if raw_line.startswith(b"Output #"):
+            break
+
+
+def _drain(stream: IO[bytes]):
+    for _ in stream:
+        pass
 
 
 async def reencode(
@@ -15,37 +40,68 @@ async def reencode(
     output_path: Path,
     output_params: dict[str, str],
     progress_callback: ProgressCallbackType,
-    duration: float,
-):
-    def work(_):
+    duration: Optional[float] = None,
+    duration_callback: Optional[Callable[[float], Awaitable[Any]]] = None,
+) -> float:
+    """
+    Reencode `input_path` to `output_path`. If the `duration` of the input file is not
+    known yet, it is read from the ffmpeg log output and passed to `duration_callback`
+    as soon as it is known. Returns the duration.
+    """
+
+    def work(queue):
+        nonlocal duration
+
+        # if the duration is unknown, ffmpeg needs to log the input information
+        log_params = (
+            {"loglevel": "quiet", "stats": None}
+            if duration is not None
+            else {"loglevel": "info", "nostats": None}
+        )
         cmd: subprocess.Popen = (
-            ffmpeg.input(input_path)
+            ffmpeg.input(input_path, **FAST_PROBE_PARAMS)
             .output(
                 filename=output_path,
                 map="0:a",
-                loglevel="quiet",
-                stats=None,
                 progress="-",
                 map_metadata="-1",
+                **log_params,
                 **output_params
             )
-            .run_async(pipe_stdout=True)
+            .run_async(pipe_stdout=True, pipe_stderr=duration is None)
         )
         assert cmd.stdout
+        if duration is None:
+            assert cmd.stderr
+            duration = _read_duration(cmd.stderr)
+            # keep reading so ffmpeg never blocks on a full stderr pipe
+            threading.Thread(target=_drain, args=(cmd.stderr,), daemon=True).start()
+            if duration is None:
+                duration = get_duration(input_path)
+            queue.submit(duration)
+
+        # ffmpeg reports a dozen keys per progress update, we only care about two
+        inv_duration = 1 / duration if duration else 0
         raw_line: bytes
-        progress_dict = {}
+        out_time_ms = None
         for raw_line in cmd.stdout:
-            key, value = raw_line.decode().strip().split("=", maxsplit=1)
-            progress_dict[key] = value.strip()
-
-            if key == "progress":
-                if "out_time_ms" in progress_dict:
-                    out_time_ms = int(progress_dict["out_time_ms"])
-                    out_time_s = out_time_ms / 1e6
+            key, _, value = raw_line.partition(b"=")
+            if key == b"out_time_ms":
+                out_time_ms = value
+            elif key == b"progress":
+                if out_time_ms is not None:
+                    out_time_s = int(out_time_ms) / 1e6
                     progress_callback(
-                        progress=out_time_s / duration,
-                        extra_data=progress_dict,
+                        progress=out_time_s * inv_duration,
+                        extra_data={
+                            "out_time_ms": out_time_ms.decode().strip(),
+                            "progress": value.decode().strip(),
+                        },
                     )
-                progress_dict = {}
+                out_time_ms = None
 
-    await alist(aiter(async_task(work)))
+    async for read_duration in async_task(work):
+        if duration_callback is not None:
+            await duration_callback(read_duration)
+    assert duration is not None
+    return duration
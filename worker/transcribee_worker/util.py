@@ -88,3 +88,45 @@ async def aenumerate(iterable, start=0):
 
 async def alist(iterable):
     return [item async for item in iterable]
+
+
+async def abatch(iterable, max_size: int, max_wait: float):
+    """
+    Group the items of an async iterable into lists of at most `max_size` items.
+    A partial batch is emitted as soon as no new item arrives for `max_wait` seconds.
+    """
+    iterator = aiter(iterable)
+    next_item = None
+    batch = []
+    try:
+        while True:
+            if next_item is None:
+                next_item = asyncio.ensure_future(anext(iterator))
+            done, _ = await asyncio.wait(
+                {next_item}, timeout=max_wait if batch else None
+            )
+            if not done:
+                yield batch
+                batch = []
+                continue
+
+            next_item = None
+            try:
+                batch.append(done.pop().result())
+            except StopAsyncIteration:
+                break
+            except Exception:
+                # hand out what we already have before propagating the error
+                if batch:
+                    yield batch
+                raise
+
+            if len(batch) >= max_size:
+                yield batch
+                batch = []
+    finally:
+        if next_item is not None:
+            next_item.cancel()
+
+    if batch:
+        yield batch
@@ -1,12 +1,14 @@
 import asyncio
 import logging
 import mimetypes
+import shutil
 import tempfile
 import time
 import traceback
 from contextlib import asynccontextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, AsyncGenerator, Optional, Tuple
+from typing import Any, AsyncGenerator, Optional
 
 import automerge
 import numpy.typing as npt
@@ -20,16 +22,24 @@ from transcribee_proto.api import (
     TranscribeTask,
 )
 from transcribee_proto.api import Document as ApiDocument
+from transcribee_proto.document import Atom, Paragraph
 from transcribee_proto.document import Document as EditorDocument
 from transcribee_worker.api_client import ApiClient
 from transcribee_worker.config import settings
 from transcribee_worker.identify_speakers import identify_speakers
-from transcribee_worker.reencode import get_duration, reencode
+from transcribee_worker.reencode import reencode
 from transcribee_worker.torchaudio_align import align
 from transcribee_worker.types import ProgressCallbackType
-from transcribee_worker.util import aenumerate, load_audio
+from transcribee_worker.util import abatch, aenumerate, load_audio
 from transcribee_worker.whisper_transcribe import transcribe_clean
 
+AUDIO_DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # bytes
+
+
+@lru_cache(maxsize=64)
+def extension_for_content_type(content_type: str) -> str:
+    return mimetypes.guess_extension(content_type) or ".bin"
+
 
 def normalize_for_automerge(value):
     def normalize_value(k, v):
@@ -72,10 +82,33 @@ def get_last_atom_end(doc: EditorDocument):
     return 0
 
 
+def dump_editor_document(doc: automerge.Document) -> EditorDocument:
+    # The data comes straight out of the CRDT, so we can skip pydantic's (expensive)
+    # validation and construct the models directly
+    data = automerge.dump(doc)
+    return EditorDocument.construct(
+        **{
+            **data,
+            "children": [
+                Paragraph.construct(
+                    **{
+                        **paragraph,
+                        "children": [
+                            Atom.construct(**atom) for atom in paragraph["children"]
+                        ],
+                    }
+                )
+                for paragraph in data["children"]
+            ],
+        }
+    )
+
+
 class Worker:
     base_url: str
     token: str
     tmpdir: Optional[Path]
+    _scratch_dir: tempfile.TemporaryDirectory
     task_types: list[TaskType]
     progress: Optional[float]
 
@@ -88,6 +121,8 @@ class Worker:
     ):
         self.api_client = ApiClient(base_url, websocket_base_url, token)
         self.tmpdir = None
+        # the scratch directory is reused for all tasks and only emptied in between
+        self._scratch_dir = tempfile.TemporaryDirectory(prefix="transcribee-worker-")
         if task_types is not None:
             self.task_types = task_types
         else:
@@ -98,10 +133,11 @@ class Worker:
                 TaskType.REENCODE,
             ]
 
-    def claim_task(self) -> Optional[AssignedTask]:
+    async def claim_task(self) -> Optional[AssignedTask]:
         logging.info("Asking backend for new task")
-        req = self.api_client.post(
-            "tasks/claim_unassigned_task/", params={"task_type": self.task_types}
+        req = await self.api_client.post(
+            "tasks/claim_unassigned_task/",
+            params={"task_type": [task_type.value for task_type in self.task_types]},
         )
         return parse_raw_as(Optional[AssignedTask], req.text)
 
@@ -110,9 +146,16 @@ class Worker:
             raise ValueError("`tmpdir` must be set")
         return self.tmpdir / filename
 
-    def get_document_audio_bytes(
-        self, document: ApiDocument
-    ) -> Optional[Tuple[bytes, str]]:
+    def _clear_tmpdir(self):
+        if self.tmpdir is not None:
+            for path in self.tmpdir.iterdir():
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+        self.tmpdir = None
+
+    async def get_document_audio_path(self, document: ApiDocument) -> Optional[Path]:
         logging.debug(f"Getting audio. {document=}")
         if not document.media_files:
             return
@@ -121,33 +164,29 @@ class Worker:
             if "profile:mp3" in mf.tags:
                 media_file = mf
                 break
-        response = self.api_client.get(media_file.url)
-        return response.content, media_file.content_type
-
-    def get_document_audio_path(self, document: ApiDocument) -> Optional[Path]:
-        b = self.get_document_audio_bytes(document=document)
-        if b is not None:
-            b, ct = b
-            extension = mimetypes.guess_extension(ct)
-            path = self._get_tmpfile(f"doc_audio{extension}")
+
+        extension = extension_for_content_type(media_file.content_type)
+        path = self._get_tmpfile(f"doc_audio{extension}")
+        async with self.api_client.stream(media_file.url) as response:
             with open(path, "wb") as f:
-                f.write(b)
-            return path
+                async for chunk in response.aiter_bytes(AUDIO_DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        return path
 
-    def load_document_audio(self, document: ApiDocument) -> npt.NDArray:
-        document_audio = self.get_document_audio_path(document)
+    async def load_document_audio(self, document: ApiDocument) -> npt.NDArray:
+        document_audio = await self.get_document_audio_path(document)
         if document_audio is None:
             raise ValueError(
                 f"Document {document} has no audio attached. Cannot identify speakers."
             )
         return load_audio(document_audio)[0]
 
-    def keepalive(self, task_id: str, progress: Optional[float]):
+    async def keepalive(self, task_id: str, progress: Optional[float]):
         body = {}
         if progress is not None:
             body["progress"] = progress
         logging.debug(f"Sending keepalive for {task_id=}: {body=}")
-        self.api_client.post(f"tasks/{task_id}/keepalive/", json=body)
+        await self.api_client.post(f"tasks/{task_id}/keepalive/", json=body)
 
     async def perform_task(self, task: AssignedTask):
         logging.info(f"Running task: {task=}")
@@ -173,7 +212,7 @@ class Worker:
     async def transcribe(
         self, task: TranscribeTask, progress_callback: ProgressCallbackType
     ):
-        audio = self.load_document_audio(task.document)
+        audio = await self.load_document_audio(task.document)
 
         async with self.api_client.document(task.document.id) as doc:
 
@@ -185,22 +224,28 @@ class Worker:
 
             audio = audio[int(start_offset * settings.SAMPLE_RATE) :]
 
-            async for paragraph in transcribe_clean(
-                data=audio,
-                start_offset=start_offset,
-                model_name=task.task_parameters.model,
-                lang_code=task.task_parameters.lang,
-                progress_callback=progress_callback,
-            ):
+            paragraph_batches = abatch(
+                transcribe_clean(
+                    data=audio,
+                    start_offset=start_offset,
+                    model_name=task.task_parameters.model,
+                    lang_code=task.task_parameters.lang,
+                    progress_callback=progress_callback,
+                ),
+                max_size=settings.CHANGE_BATCH_SIZE,
+                max_wait=settings.CHANGE_BATCH_INTERVAL,
+            )
+            async for paragraphs in paragraph_batches:
                 async with doc.transaction("Automatic Transcription") as d:
-                    p = paragraph.dict()
-                    normalize_for_automerge(p)
-                    d.children.append(p)
+                    for paragraph in paragraphs:
+                        p = paragraph.dict()
+                        normalize_for_automerge(p)
+                        d.children.append(p)
 
     async def identify_speakers(
         self, task: SpeakerIdentificationTask, progress_callback: ProgressCallbackType
     ):
-        audio = self.load_document_audio(task.document)
+        audio = await self.load_document_audio(task.document)
         assert (
             task.task_parameters.number_of_speakers != 0
         )  # this would not make any sense
@@ -215,11 +260,10 @@ class Worker:
                 )
 
     async def align(self, task: AlignTask, progress_callback: ProgressCallbackType):
-        audio = self.load_document_audio(task.document)
+        audio = await self.load_document_audio(task.document)
 
         async with self.api_client.document(task.document.id) as doc:
-            # TODO(robin): #perf: avoid this copy
-            document = EditorDocument.parse_obj(automerge.dump(doc.doc))
+            document = dump_editor_document(doc.doc)
 
             aligned_para_iter = aiter(
                 align(
@@ -230,30 +274,35 @@ class Worker:
                     extend_duration=0.5,
                 )
             )
-            async for i, al_para in aenumerate(aligned_para_iter):
+            aligned_para_batches = abatch(
+                aenumerate(aligned_para_iter),
+                max_size=settings.CHANGE_BATCH_SIZE,
+                max_wait=settings.CHANGE_BATCH_INTERVAL,
+            )
+            async for al_paras in aligned_para_batches:
                 async with doc.transaction("Alignment") as d:
-                    d_para = d.children[i]
-                    for d_atom, al_atom in zip(d_para.children, al_para.children):
-                        d_atom.start = al_atom.start
-                        d_atom.end = al_atom.end
+                    for i, al_para in al_paras:
+                        d_para = d.children[i]
+                        for d_atom, al_atom in zip(d_para.children, al_para.children):
+                            d_atom.start = al_atom.start
+                            d_atom.end = al_atom.end
 
     async def reencode(
         self, task: ReencodeTask, progress_callback: ProgressCallbackType
     ):
-        document_audio = self.get_document_audio_path(task.document)
+        document_audio = await self.get_document_audio_path(task.document)
         if document_audio is None:
             raise ValueError(
                 f"Document {task.document} has no audio attached. Cannot reencode."
             )
 
-        duration = get_duration(document_audio)
-        self.set_duration(task, duration)
-
+        # the duration is determined while reencoding the first profile
+        duration = None
         n_profiles = len(settings.REENCODE_PROFILES)
         for i, (profile, parameters) in enumerate(settings.REENCODE_PROFILES.items()):
             output_path = self._get_tmpfile(f"reencode_{profile}")
 
-            await reencode(
+            duration = await reencode(
                 document_audio,
                 output_path,
                 parameters,
@@ -263,46 +312,49 @@ class Worker:
                     **kwargs,
                 ),
                 duration,
+                lambda duration: self.set_duration(task, duration),
             )
 
             tags = [f"profile:{profile}"] + [f"{k}:{v}" for k, v in parameters.items()]
 
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(
-                None, self.add_document_media_file, task, output_path, tags
-            )
+            await self.add_document_media_file(task, output_path, tags)
 
-    def set_duration(self, task: AssignedTask, duration: float):
+    async def set_duration(self, task: AssignedTask, duration: float):
         logging.debug(
             f"Setting audio duration for document {task.document.id=} {duration=}"
         )
-        self.api_client.post(
+        await self.api_client.post(
             f"documents/{task.document.id}/set_duration/", json={"duration": duration}
         )
 
-    def add_document_media_file(self, task: AssignedTask, path: Path, tags: list[str]):
+    async def add_document_media_file(
+        self, task: AssignedTask, path: Path, tags: list[str]
+    ):
         logging.debug(f"Replacing document audio for document {task.document.id=}")
-        self.api_client.post(
-            f"documents/{task.document.id}/add_media_file/",
-            files={"file": open(path, "rb")},
-            data=[("tags", tag) for tag in tags],
-        )
+        with open(path, "rb") as f:
+            await self.api_client.post(
+                f"documents/{task.document.id}/add_media_file/",
+                files={"file": f},
+                data={"tags": tags},
+            )
 
-    def mark_completed(self, task_id: str, additional_data: Optional[dict] = None):
+    async def mark_completed(
+        self, task_id: str, additional_data: Optional[dict] = None
+    ):
         extra_data = {**self._result_data}
         if additional_data:
             extra_data.update(additional_data)
         body = {"extra_data": extra_data if extra_data is not None else {}}
         logging.debug(f"Marking task as completed {task_id=} {body=}")
-        self.api_client.post(f"tasks/{task_id}/mark_completed/", json=body)
+        await self.api_client.post(f"tasks/{task_id}/mark_completed/", json=body)
 
-    def mark_failed(self, task_id: str, additional_data: Optional[dict] = None):
+    async def mark_failed(self, task_id: str, additional_data: Optional[dict] = None):
         extra_data = {**self._result_data}
         if additional_data:
             extra_data.update(additional_data)
         body = {"extra_data": extra_data if extra_data is not None else {}}
         logging.debug(f"Marking task as completed {task_id=} {body=}")
-        self.api_client.post(f"tasks/{task_id}/mark_failed/", json=body)
+        await self.api_client.post(f"tasks/{task_id}/mark_failed/", json=body)
 
     def _set_progress(
         self, task_id: str, step: str, progress: Optional[float], extra_data: Any = None
@@ -324,41 +376,58 @@ class Worker:
         stop_event = asyncio.Event()
 
         async def _work():
+            last_progress = None
+            last_sent = 0.0
             while not stop_event.is_set():
+                # Progress callbacks only record the latest progress, here we send it
+                # at most every `seconds`. If the progress didn't change, we only need
+                # to tell the backend that we are still alive once in a while.
+                progress = self.progress
+                now = time.monotonic()
+                if (
+                    progress != last_progress
+                    or now - last_sent >= settings.KEEPALIVE_MAX_INTERVAL
+                ):
+                    try:
+                        await self.keepalive(task_id, progress)
+                        last_progress, last_sent = progress, now
+                    except Exception as exc:
+                        logging.error("Keepliave failed", exc_info=exc)
                 try:
-                    self.keepalive(task_id, self.progress)
-                except Exception as exc:
-                    logging.error("Keepliave failed", exc_info=exc)
-                await asyncio.sleep(seconds)
+                    await asyncio.wait_for(stop_event.wait(), timeout=seconds)
+                except asyncio.TimeoutError:
+                    pass
 
         task = asyncio.create_task(_work())
 
-        yield
-
-        stop_event.set()
-        await task
+        try:
+            yield
+        finally:
+            stop_event.set()
+            await task
 
     async def run_task(self, mark_completed=True):
-        task = self.claim_task()
+        task = await self.claim_task()
         no_work = False
         self._result_data = {"progress": []}
 
         if task is not None:
             try:
                 self.progress = None
-                with tempfile.TemporaryDirectory() as tmpdir:
+                self.tmpdir = Path(self._scratch_dir.name)
+                try:
                     async with self.keepalive_task(
                         task.id, settings.KEEPALIVE_INTERVAL
                     ):
-                        self.tmpdir = Path(tmpdir)
                         task_result = await self.perform_task(task)
                         logging.info(f"Worker returned: {task_result=}")
                         if mark_completed:
-                            self.mark_completed(task.id, {"result": task_result})
-                self.tmpdir = None
+                            await self.mark_completed(task.id, {"result": task_result})
+                finally:
+                    self._clear_tmpdir()
             except Exception as exc:
                 logging.warning("Worker failed with exception", exc_info=exc)
-                self.mark_failed(
+                await self.mark_failed(
                     task.id, {"exception": traceback.format_exception(exc)}
                 )
         else: